@@ -2,11 +2,29 @@
 
 from typing import overload
 
-import altair as alt
+import numpy as np
 import pandas as pd
 import streamlit as st
 from numpy.typing import ArrayLike, NDArray
 
+SALARY_TYPES = ('Salary', 'Eroded Salary', 'Target Salary')
+# Vega-Lite spec of the salary chart, the data is passed separately at each rerun
+CHART_SPEC = {
+    'mark': {'type': 'line', 'point': True},
+    'encoding': {
+        'x': {'field': 'year', 'type': 'temporal', 'axis': {'title': ''}},
+        'y': {'field': 'Value', 'type': 'quantitative', 'axis': {'title': ''}},
+        'color': {
+            'field': 'Salary',
+            'type': 'nominal',
+            'scale': {'domain': list(SALARY_TYPES), 'range': ['#468FE6', '#E64662', '#2CDC15']},
+            'legend': {'orient': 'bottom', 'title': ''},
+        },
+    },
+    # Equivalent of Altair's `.interactive()`: pan and zoom on both axes
+    'params': [{'name': 'grid', 'select': {'type': 'interval', 'encodings': ['x', 'y']}, 'bind': 'scales'}],
+}
+
 st.title('Salary vs Inflation')
 st.markdown("""
     This tool shows the effect of inflation on your buying power.  
@@ -41,47 +59,132 @@ with st.expander('Additional information'):
 
 
 @st.cache_data
-def load_cpi():
-    return pd.read_csv('data/cpi_by_year.csv', index_col='year')
+def load_cpi() -> tuple[pd.DataFrame, NDArray[np.float64], int]:
+    """Load CPI data, also returned as a plain array starting at the first year for fast lookups."""
+    cpi_df = pd.read_csv('data/cpi_by_year.csv', index_col='year')
+    return cpi_df, cpi_df.iloc[:, 0].to_numpy(dtype=np.float64), int(cpi_df.index.min())
 
 
 # Load CPI data and show in the sidebar
 with st.sidebar:
     data_load_state = st.text('Loading CPI data...')
-    cpi_year = load_cpi()
+    cpi_year, CPI_ARR, BASE_YEAR = load_cpi()
+    END_YEAR = int(cpi_year.index.max()) + 1
     data_load_state.text('Info: CPI data loaded')
     st.subheader('CPI Data (ONS)')
     st.dataframe(cpi_year, height=600)
 
 
+def _cpi_offset(year: ArrayLike) -> NDArray[np.int64]:
+    """Convert years to indices into `CPI_ARR`, raising a `KeyError` for years without CPI data."""
+    offset = np.asarray(year, dtype=np.int64) - BASE_YEAR
+    if np.any((offset < 0) | (offset >= CPI_ARR.size)):
+        raise KeyError(f'No CPI data outside of {BASE_YEAR}-{BASE_YEAR + CPI_ARR.size - 1}')
+    return offset
+
+
 @overload
 def calculate_inflation(year1: int, year2: int) -> float: ...
 @overload
 def calculate_inflation(year1: ArrayLike, year2: ArrayLike) -> NDArray: ...
 def calculate_inflation(year1, year2):
-    """Calculate inflation between `year1` and `year2` as the ratio of CPIs."""
-    return cpi_year.loc[year2].to_numpy() / cpi_year.loc[year1].to_numpy()
+    """Calculate inflation between `year1` and `year2` as the ratio of CPIs.
+
+    Years can also be arrays (broadcast against each other), to process many pairs of years in one call.
+    """
+    return CPI_ARR[_cpi_offset(year2)] / CPI_ARR[_cpi_offset(year1)]
+
+
+@st.cache_data
+def _normalize_salaries(items: tuple[tuple[int, float], ...]) -> tuple[NDArray[np.int64], NDArray[np.float64]]:
+    """Split (year, salary) pairs into arrays of years and salaries, sorted by year.
+
+    Entries without a salary (e.g. a row just added in the table) are dropped.
+    """
+    years = np.array([year for year, _ in items], dtype=np.int64)
+    values = np.array([value for _, value in items], dtype=np.float64)
+    order = np.argsort(years)
+    years, values = years[order], values[order]
+    has_salary = ~np.isnan(values)
+    return years[has_salary], values[has_salary]
 
 
 def calculate_adjusted_salaries(salaries_dict: dict[int, float], target_year: int | None = None) -> pd.DataFrame:
-    """Transform salaries from a given year to a target year."""
-    salaries = pd.Series(salaries_dict, name='Salary').rename_axis(index='year').sort_index().to_frame()
-    all_salaries, _ = salaries.align(pd.DataFrame([[0]], index=pd.RangeIndex(salaries.index[0], 2025)), axis=0)
-    all_salaries['reference'] = salaries.index.to_series().astype(int)
-    all_salaries = all_salaries.ffill().bfill().rename_axis(index='year')
+    """Transform salaries from a given year to a target year.
+
+    The app goes through `calculate_all_adjusted_salaries`; this is the entry point for a single target year.
+    """
+    known_years, known_salary = _normalize_salaries(tuple(sorted(salaries_dict.items())))
+    _cpi_offset(known_years)  # raises for entries outside the CPI data, rather than dropping them
+    return _adjust_salaries(known_years, known_salary, target_year)
+
+
+def _adjust_salaries(
+    known_years: NDArray[np.int64], known_salary: NDArray[np.float64], target_year: int | None
+) -> pd.DataFrame:
+    """Transform salaries already normalized by `_normalize_salaries` to a target year.
+
+    Years must have been checked against the CPI data by the caller.
+    """
+    # Each year takes the salary of the latest entry on or before it
+    all_years = np.arange(known_years[0], END_YEAR)
+    idx = np.clip(np.searchsorted(known_years, all_years, side='right') - 1, 0, None)
+    salary = known_salary[idx]
+    reference = known_years[idx]
 
     if target_year is None:
-        inflation = calculate_inflation(all_salaries['reference'], all_salaries.index).flatten()
+        inflation = calculate_inflation(reference, all_years)
     else:
-        inflation = calculate_inflation(target_year, all_salaries.index).flatten()
+        inflation = calculate_inflation(target_year, all_years)
+
+    # Both adjusted salaries share the inflation vector: invert it once, then only multiply
+    eroded_and_target = salary[:, np.newaxis] * np.stack([1.0 / inflation, inflation], axis=1)
+
+    # All columns are computed with NumPy, the DataFrame is only built for display
+    all_salaries = pd.DataFrame(
+        {
+            'Salary': salary,
+            'reference': reference,
+            'Eroded Salary': eroded_and_target[:, 0],
+            'Target Salary': eroded_and_target[:, 1],
+        },
+        # Dates (rather than years) make for better looking plots.
+        # `datetime64[Y]` counts years from the 1970 epoch, hence the offset.
+        index=pd.DatetimeIndex((all_years - 1970).astype('datetime64[Y]').astype('datetime64[ns]'), name='year'),
+    )
 
-    all_salaries['Eroded Salary'] = all_salaries['Salary'] / inflation
-    all_salaries['Target Salary'] = all_salaries['Salary'] * inflation
+    return all_salaries
 
-    # This ensures better looking plots because of the date index
-    all_salaries.index = pd.to_datetime(all_salaries.index, format='%Y')
 
-    return all_salaries
+# `cache_resource` returns the cached dict itself: `cache_data` would copy every frame on each rerun.
+# The frames are only read afterwards, never modified.
+@st.cache_resource
+def calculate_all_adjusted_salaries(
+    salaries_items: tuple[tuple[int, float], ...], max_year: int
+) -> dict[int | None, pd.DataFrame]:
+    """Transform salaries for every possible reference year, and with no reference year (key `None`).
+
+    Reference years go from the first salary entry to `max_year`.
+    The CPI data is not part of the cache key: it is loaded once by the (also cached) `load_cpi`.
+    """
+    known_years, known_salary = _normalize_salaries(salaries_items)
+    _cpi_offset(known_years)  # raises for entries outside the CPI data, rather than dropping them
+    all_adjusted_salaries: dict[int | None, pd.DataFrame] = {
+        year: _adjust_salaries(known_years, known_salary, target_year=year)
+        for year in range(int(known_years[0]), max_year + 1)
+    }
+    all_adjusted_salaries[None] = _adjust_salaries(known_years, known_salary, target_year=None)
+    return all_adjusted_salaries
+
+
+@st.cache_data
+def to_longform(adjusted_salaries: pd.DataFrame) -> pd.DataFrame:
+    """Stack the salary columns into the long format used by the chart."""
+    return pd.DataFrame({
+        'year': adjusted_salaries.index.repeat(len(SALARY_TYPES)),
+        'Salary': np.tile(np.array(SALARY_TYPES), len(adjusted_salaries)),
+        'Value': adjusted_salaries[list(SALARY_TYPES)].to_numpy().ravel(),
+    })
 
 
 # Input table
@@ -89,39 +192,33 @@ st.subheader('Your salary (per year)', divider=True)
 st.caption('Edit the table below to enter your own data. Rows can be added or removed.')
 salaries = {2002: 24000.0, 2014: 35000, 2022: 55000}
 salaries = st.data_editor(salaries, num_rows='dynamic', column_config={'_index': 'Year', 'value': 'Salary'})
+invalid_years = sorted(year for year in salaries if not BASE_YEAR <= year < END_YEAR)
+if invalid_years:
+    st.error(f'No CPI data for {invalid_years}: years must be between {BASE_YEAR} and {END_YEAR - 1}.')
+    st.stop()
 
 st.subheader('Effect of inflation on your salary', divider=True)
 plot_container = st.empty()  # empty container to display widgets out of order
 
 # Reference year slider
 with st.container(border=True):
-    min_year = min(list(salaries.keys()))
+    salaries_items = tuple(sorted(salaries.items()))  # type: ignore
+    known_years, _ = _normalize_salaries(salaries_items)
+    if known_years.size == 0:
+        st.info('Enter at least one salary in the table above.')
+        st.stop()
+    min_year = int(known_years[0])
+    # Results for all reference years, so that moving the slider is a simple lookup
+    all_adjusted_salaries = calculate_all_adjusted_salaries(salaries_items, END_YEAR - 1)
     if st.checkbox('Use a single reference year'):
-        reference_year = st.slider('Reference Year', min_year, 2024, 2002)
-        adjusted_salaries = calculate_adjusted_salaries(salaries, target_year=reference_year)  # type: ignore
+        reference_year = st.slider('Reference Year', min_year, END_YEAR - 1, 2002)
+        adjusted_salaries = all_adjusted_salaries[reference_year]
     else:
-        reference_year = st.slider('Reference Year', min_year, 2024, 2002, disabled=True)
-        adjusted_salaries = calculate_adjusted_salaries(salaries, target_year=None)  # type: ignore
-
-salary_types = ['Salary', 'Eroded Salary', 'Target Salary']
-adjusted_salaries_longform = (
-    adjusted_salaries[salary_types].reset_index().melt('year', var_name='Salary', value_name='Value')
-)
-
-chart1 = (
-    alt.Chart(adjusted_salaries_longform)
-    .mark_line(point=True)
-    .encode(
-        alt.X('year', type='temporal').axis(title=''),
-        alt.Y('Value', type='quantitative').axis(title=''),
-        color=alt.Color('Salary')
-        .scale(domain=salary_types, range=['#468FE6', '#E64662', '#2CDC15'])
-        .legend(orient='bottom', title=''),
-    )
-    .interactive()
-)
+        reference_year = st.slider('Reference Year', min_year, END_YEAR - 1, 2002, disabled=True)
+        adjusted_salaries = all_adjusted_salaries[None]
 
-plot_container.altair_chart(chart1, use_container_width=True)
+adjusted_salaries_longform = to_longform(adjusted_salaries)
+plot_container.vega_lite_chart(adjusted_salaries_longform, CHART_SPEC, use_container_width=True)
 
 with st.expander('Results as a table'):
     st.dataframe(adjusted_salaries, hide_index=False)